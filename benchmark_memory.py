@@ -0,0 +1,197 @@
+"""
+Memory and latency sweep for the WebSocket function
+
+Runs prompt turns through the WebSocket lambda_handler against in-process
+stand-ins for Bedrock, DynamoDB and API Gateway, across a range of conversation
+history lengths. Each history length gets two passes: a timing pass with
+PROFILE_MEMORY off, so tracemalloc overhead does not inflate the latencies, and
+a separate PROFILE_MEMORY pass for the per-stage tracemalloc peaks. Prints a
+markdown table merging both, with the handler CPU time scaled to each Lambda
+memory size (Lambda allocates CPU in proportion to memory, one full vCPU at
+1769 MB).
+
+The max RSS column is the high-water mark of the whole benchmark process. It
+only grows across rows, so a later row reflects every history length run so
+far rather than that length on its own.
+
+Usage:
+    python benchmark_memory.py --turns 0,10,50,100,200 --memory-sizes 128,256,512,1024
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import boto3
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import src.websocket.app as app
+
+LAMBDA_FULL_VCPU_MB = 1769
+STAGES = ("get_session", "ai_response", "save_session")
+USER_TEXT = "Can you tell me what the weather is going to be like in Boston tomorrow afternoon? "
+ASSISTANT_TEXT = "Tomorrow afternoon in Boston expect partly cloudy skies with a high of sixty two degrees. " * 4
+
+
+class FakeTable:
+    """DynamoDB table stand-in keeping items in a dict"""
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key):
+        item = self.items.get(Key['connection_id'])
+        return {'Item': item} if item else {}
+
+    def put_item(self, Item):
+        self.items[Item['connection_id']] = Item
+
+
+class FakeBedrock:
+    """Bedrock runtime stand-in streaming a fixed answer in small deltas"""
+
+    def __init__(self, deltas):
+        self.deltas = deltas
+
+    def converse_stream(self, **kwargs):
+        return {"stream": [{"contentBlockDelta": {"delta": {"text": "word "}}} for _ in range(self.deltas)]}
+
+
+class FakeApiGateway:
+    """API Gateway management client stand-in that drops posted frames"""
+
+    def post_to_connection(self, ConnectionId, Data):
+        pass
+
+
+def build_history(turns):
+    """Build a stored conversation with the given number of user/assistant turns"""
+    conversation = [{"role": "system", "content": app.SYSTEM_PROMPT}]
+    for _ in range(turns):
+        conversation.append({"role": "user", "content": USER_TEXT})
+        conversation.append({"role": "assistant", "content": ASSISTANT_TEXT})
+    return conversation
+
+
+def prompt_event():
+    """Create a final prompt event for the benchmark connection"""
+    return {
+        'requestContext': {
+            'connectionId': 'benchmark-connection',
+            'routeKey': '$default',
+            'domainName': 'benchmark.execute-api.us-east-1.amazonaws.com',
+            'stage': 'prod'
+        },
+        'body': json.dumps({'type': 'prompt', 'voicePrompt': USER_TEXT, 'last': True})
+    }
+
+
+def time_stages(timings):
+    """Wrap the handler stages with wall-clock timers that append to timings"""
+    originals = {stage: getattr(app, stage) for stage in STAGES}
+
+    def timed(stage, fn):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[stage].append((time.perf_counter() - started) * 1000)
+        return wrapper
+
+    for stage, fn in originals.items():
+        setattr(app, stage, timed(stage, fn))
+    return originals
+
+
+def run_turns(table, history, repeats):
+    """Run prompt turns against a fresh copy of history, returning the CPU ms of each"""
+    cpu_samples = []
+    for _ in range(repeats):
+        table.items['benchmark-connection'] = {'connection_id': 'benchmark-connection', 'conversation': history}
+        started = time.process_time()
+        app.lambda_handler(prompt_event(), None)
+        cpu_samples.append((time.process_time() - started) * 1000)
+    return cpu_samples
+
+
+def run_sweep(turn_counts, repeats, deltas):
+    """Time and profile prompt turns for each history length and return one row per length"""
+    table = FakeTable()
+    app.table = table
+    app.bedrock_runtime = FakeBedrock(deltas)
+    boto3.client = lambda *args, **kwargs: FakeApiGateway()
+
+    rows = []
+    for turns in turn_counts:
+        history = json.dumps(build_history(turns))
+        row = {"turns": turns, "history_kb": round(len(history) / 1024, 1)}
+
+        # Timing pass without tracemalloc
+        os.environ['PROFILE_MEMORY'] = 'false'
+        timings = {stage: [] for stage in STAGES}
+        originals = time_stages(timings)
+        try:
+            cpu_samples = run_turns(table, history, repeats)
+        finally:
+            for stage, fn in originals.items():
+                setattr(app, stage, fn)
+        row["cpu_ms"] = round(statistics.median(cpu_samples), 2)
+        for stage in STAGES:
+            row[f"{stage}_ms"] = round(statistics.median(timings[stage]), 2)
+
+        # Memory pass with tracemalloc, latencies from this pass are discarded
+        os.environ['PROFILE_MEMORY'] = 'true'
+        peaks = {stage: 0.0 for stage in STAGES}
+        for _ in range(repeats):
+            run_turns(table, history, 1)
+            for stage in STAGES:
+                peaks[stage] = max(peaks[stage], app.memory_profile[stage]["peak_kb"])
+        for stage in STAGES:
+            row[f"{stage}_kb"] = peaks[stage]
+        row["max_rss_mb"] = app.memory_profile["max_rss_mb"]
+        rows.append(row)
+    return rows
+
+
+def print_table(rows, memory_sizes):
+    """Print the sweep results as a markdown table"""
+    header = ["turns", "history KB", "get_session KB/ms", "ai_response KB/ms", "save_session KB/ms", "process max RSS MB"]
+    header += [f"CPU ms @{size}MB" for size in memory_sizes]
+    print("| " + " | ".join(header) + " |")
+    print("|" + "---|" * len(header))
+    for row in rows:
+        cells = [row["turns"], row["history_kb"]]
+        for stage in STAGES:
+            cells.append(f"{row[f'{stage}_kb']} / {row[f'{stage}_ms']}")
+        cells.append(row["max_rss_mb"])
+        # Assumes the local core is comparable to one Lambda vCPU
+        cells += [round(row["cpu_ms"] * max(1.0, LAMBDA_FULL_VCPU_MB / size), 1) for size in memory_sizes]
+        print("| " + " | ".join(str(cell) for cell in cells) + " |")
+    print()
+    print("KB are tracemalloc peaks; ms and CPU ms come from a separate pass with tracemalloc off.")
+    print("Process max RSS is a high-water mark that only grows across rows, not a per-row figure.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and latency sweep for the WebSocket function")
+    parser.add_argument("--turns", default="0,10,50,100,200", help="comma separated history lengths in turns")
+    parser.add_argument("--memory-sizes", default="128,256,512,1024", help="comma separated Lambda memory sizes in MB")
+    parser.add_argument("--repeats", type=int, default=5, help="prompt turns per history length")
+    parser.add_argument("--deltas", type=int, default=200, help="streamed deltas per response")
+    args = parser.parse_args()
+
+    # Keep per-turn log lines out of the table output
+    app.logger.setLevel("WARNING")
+
+    turn_counts = [int(turns) for turns in args.turns.split(",")]
+    memory_sizes = [int(size) for size in args.memory_sizes.split(",")]
+    print_table(run_sweep(turn_counts, args.repeats, args.deltas), memory_sizes)
+
+
+if __name__ == "__main__":
+    main()
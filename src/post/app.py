@@ -23,11 +23,14 @@ def lambda_handler(event, context):
     # Construct WebSocket URL
     ws_url = f"wss://{domain}/{stage}"
     
+    # Partial prompts feed speculative generation in the WebSocket function
+    partial_prompts = "true" if os.environ.get('SPECULATIVE_MODE', 'false').lower() == 'true' else "false"
+    
     # Create TwiML response
     xml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
     <Response>
       <Connect>
-        <ConversationRelay url="{ws_url}" welcomeGreeting="{WELCOME_GREETING}" />
+        <ConversationRelay url="{ws_url}" welcomeGreeting="{WELCOME_GREETING}" partialPrompts="{partial_prompts}" />
       </Connect>
     </Response>"""
     
@@ -2,8 +2,17 @@ import json
 import boto3
 import os
 import logging
+import queue
+import re
+import resource
+import threading
 import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
 from boto3.dynamodb.conditions import Key
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 # Configure logging
 logger = logging.getLogger()
@@ -11,66 +20,270 @@ logger.setLevel(logging.INFO)
 
 # Configuration
 SYSTEM_PROMPT = "You are a helpful assistant. This conversation is being translated to voice, so answer carefully. When you respond, please spell out all numbers, for example twenty not 20. Do not include emojis in your responses. Do not include bullet points, asterisks, or special symbols."
+APOLOGY_MESSAGE = "I'm sorry, I'm having trouble processing your request right now."
+INFERENCE_CONFIG = {
+    "temperature": 0.7,
+    "maxTokens": 1024
+}
+
+# Speculative generation only starts once a partial prompt has this many words
+SPECULATIVE_MIN_WORDS = 3
+# A speculating generation re-checks its claim every this many streamed chunks
+SPECULATIVE_CLAIM_CHECK_CHUNKS = 10
+
+# Client configuration: fail fast on connect, bound each read and keep
+# connections alive so one slow call cannot consume the function Timeout
+BEDROCK_CLIENT_CONFIG = Config(
+    connect_timeout=2,
+    read_timeout=10,
+    retries={"max_attempts": 2, "mode": "standard"},
+    max_pool_connections=10,
+    tcp_keepalive=True
+)
+DYNAMODB_CLIENT_CONFIG = Config(
+    connect_timeout=0.5,
+    read_timeout=1,
+    retries={"max_attempts": 2, "mode": "standard"},
+    max_pool_connections=10,
+    tcp_keepalive=True
+)
+APIGW_CLIENT_CONFIG = Config(
+    connect_timeout=0.5,
+    read_timeout=1,
+    retries={"max_attempts": 2, "mode": "standard"},
+    tcp_keepalive=True
+)
+
+def worst_case_call_ms(config):
+    """Longest a single call can take under a client config, including standard-mode retry backoff"""
+    attempts = config.retries["max_attempts"]
+    per_attempt_ms = (config.connect_timeout + config.read_timeout) * 1000
+    # Standard mode backs off at most 2^i seconds before retry i + 1
+    backoff_ms = sum(2 ** i * 1000 for i in range(attempts - 1))
+    return int(attempts * per_attempt_ms + backoff_ms)
+
+# Time kept back from persisting the turn so the handler returns before the function Timeout
+CLOSE_TURN_MARGIN_MS = 500
+# Time kept back from Bedrock and session reads to close the turn: one delta frame already
+# in flight at the deadline, the final last=True frame, then saving the session
+CLOSE_TURN_RESERVE_MS = (2 * worst_case_call_ms(APIGW_CLIENT_CONFIG)
+                         + worst_case_call_ms(DYNAMODB_CLIENT_CONFIG)
+                         + CLOSE_TURN_MARGIN_MS)
+# Remaining time assumed when the handler runs without a Lambda context (matches Timeout)
+DEFAULT_REMAINING_MS = 30000
 
 # Initialize Bedrock client outside the handler for Lambda optimization
-bedrock_runtime = boto3.client('bedrock-runtime')
+bedrock_runtime = boto3.client('bedrock-runtime', config=BEDROCK_CLIENT_CONFIG)
 
 # Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb')
+dynamodb = boto3.resource('dynamodb', config=DYNAMODB_CLIENT_CONFIG)
 table = dynamodb.Table(os.environ.get('SESSIONS_TABLE', 'TwilioSessions'))
 
-def ai_response(messages, connection_id, client):
+# CloudWatch namespace and units for the speculation metrics
+METRICS_NAMESPACE = "TwilioConversationRelay"
+SPECULATION_METRIC_UNITS = {
+    "SpeculationHit": "Count",
+    "SpeculationMiss": "Count",
+    "SpeculationNotAttempted": "Count",
+    "SpeculationWastedTokens": "Count",
+    "SpeculationTtftSavedMs": "Milliseconds"
+}
+
+# Per-stage peak memory and latency for the last prompt turn when profiling is on
+memory_profile = {}
+
+def memory_profiling_enabled():
+    """Check whether tracemalloc profiling of prompt turns is turned on"""
+    return os.environ.get("PROFILE_MEMORY", "false").lower() == "true"
+
+@contextmanager
+def profile_stage(stage):
+    """Record peak traced allocations and wall time for a stage of the prompt turn"""
+    if not memory_profiling_enabled():
+        yield
+        return
+    
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        memory_profile[stage] = {
+            "peak_kb": round((peak - baseline) / 1024, 1),
+            "ms": round(elapsed_ms, 2)
+        }
+
+def log_memory_profile():
+    """Log the per-stage profile with the process peak RSS and stop tracing"""
+    if not memory_profiling_enabled():
+        return
+    
+    tracemalloc.stop()
+    # ru_maxrss is reported in kilobytes on Linux
+    memory_profile["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    logger.info(f"Memory profile: {json.dumps(memory_profile)}")
+
+def turn_deadline(context, reserve_ms=CLOSE_TURN_RESERVE_MS):
+    """Return a monotonic deadline from the Lambda remaining time, keeping reserve_ms back"""
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    remaining_ms = get_remaining_time() if get_remaining_time else DEFAULT_REMAINING_MS
+    return time.monotonic() + max(0, remaining_ms - reserve_ms) / 1000
+
+def call_with_deadline(fn, deadline, *args, on_abandon=None, **kwargs):
+    """Call fn, raising TimeoutError if it has not returned by the deadline and passing any late result to on_abandon"""
+    if deadline is None:
+        return fn(*args, **kwargs)
+    
+    # A daemon thread per call, so an abandoned call never holds up later ones
+    result = {}
+    done = threading.Event()
+    lock = threading.Lock()
+    state = {"abandoned": False}
+    
+    def run():
+        try:
+            result["value"] = fn(*args, **kwargs)
+        except Exception as e:
+            result["error"] = e
+        with lock:
+            done.set()
+            abandoned = state["abandoned"]
+        if abandoned and on_abandon and "value" in result:
+            try:
+                on_abandon(result["value"])
+            except Exception as e:
+                logger.warning(f"Error releasing abandoned call result: {str(e)}")
+    
+    threading.Thread(target=run, daemon=True).start()
+    if not done.wait(timeout=max(0.0, deadline - time.monotonic())):
+        with lock:
+            # The call may have finished between the wait and taking the lock
+            state["abandoned"] = not done.is_set()
+        if state["abandoned"]:
+            raise TimeoutError(f"{getattr(fn, '__name__', 'call')} did not finish before the deadline")
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+def stream_with_deadline(stream, deadline):
+    """Yield events from a Bedrock stream, raising TimeoutError if the next one misses the deadline"""
+    if deadline is None:
+        yield from stream
+        return
+    
+    # A daemon thread reads the stream so a stalled read cannot block the handler
+    events = queue.Queue()
+    stop = threading.Event()
+    finished = False
+    
+    def pump():
+        try:
+            for chunk in stream:
+                if stop.is_set():
+                    return
+                events.put((chunk, None))
+            events.put((None, None))
+        except Exception as e:
+            events.put((None, e))
+    
+    threading.Thread(target=pump, daemon=True).start()
+    try:
+        while True:
+            # Buffered events still stop at the deadline, e.g. when client posts are slow
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Bedrock stream did not finish before the deadline")
+            try:
+                chunk, error = events.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError("Bedrock stream did not finish before the deadline")
+            if error:
+                raise error
+            if chunk is None:
+                finished = True
+                return
+            yield chunk
+    finally:
+        stop.set()
+        if not finished:
+            # Closing the EventStream unblocks the reader thread and frees its connection
+            close_stream(stream)
+
+def close_stream(stream):
+    """Close a Bedrock EventStream that will not be read to the end"""
+    close = getattr(stream, "close", None)
+    if close:
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"Error closing Bedrock stream: {str(e)}")
+
+def format_messages(messages):
+    """Convert conversation history to Amazon Nova format"""
+    formatted_messages = []
+    system_content = None
+    
+    # Extract system message and format other messages
+    for msg in messages:
+        if msg["role"] == "system":
+            system_content = msg["content"]
+        elif msg["role"] == "user":
+            formatted_messages.append({"role": "user", "content": [{"text": msg["content"]}]})
+        elif msg["role"] == "assistant":
+            formatted_messages.append({"role": "assistant", "content": [{"text": msg["content"]}]})
+    
+    # Format system message as list for Nova API
+    system_message = None
+    if system_content:
+        system_message = [{"text": system_content}]
+    
+    return formatted_messages, system_message
+
+def ai_response(messages, connection_id, client, deadline=None):
     """Stream response from Amazon Bedrock to the client using converse_stream"""
     model_id = os.environ.get("BEDROCK_MODEL_ID", "amazon.nova-text-pro-v1")
     try:
-        # Convert messages to Amazon Nova format
-        formatted_messages = []
-        system_content = None
+        formatted_messages, system_message = format_messages(messages)
         
-        # Extract system message and format other messages
-        for msg in messages:
-            if msg["role"] == "system":
-                system_content = msg["content"]
-            elif msg["role"] == "user":
-                formatted_messages.append({"role": "user", "content": [{"text": msg["content"]}]})
-            elif msg["role"] == "assistant":
-                formatted_messages.append({"role": "assistant", "content": [{"text": msg["content"]}]})
-        
-        # Format system message as list for Nova API
-        system_message = None
-        if system_content:
-            system_message = [{"text": system_content}]
-        
-        # Configure inference parameters
-        inference_config = {
-            "temperature": 0.7,
-            "maxTokens": 1024
-        }
-        
-        response = bedrock_runtime.converse_stream(
+        response = call_with_deadline(
+            bedrock_runtime.converse_stream,
+            deadline,
             modelId=model_id,
             messages=formatted_messages,
             system=system_message,
-            inferenceConfig=inference_config
+            inferenceConfig=INFERENCE_CONFIG,
+            on_abandon=lambda late_response: close_stream(late_response["stream"])
         )
         
-        full_response = ""
+        # Collect deltas in a list and join once instead of concatenating per chunk
+        response_parts = []
         
         # Process each chunk from the stream
-        for chunk in response["stream"]:
-            if "contentBlockDelta" in chunk:
-                content_text = chunk["contentBlockDelta"]["delta"]["text"]
-                if content_text:
-                    full_response += content_text
-                    # Send the chunk to the client
-                    client.post_to_connection(
-                        ConnectionId=connection_id,
-                        Data=json.dumps({
-                            "type": "text",
-                            "token": content_text,
-                            "last": False
-                        })
-                    )
+        try:
+            for chunk in stream_with_deadline(response["stream"], deadline):
+                if "contentBlockDelta" in chunk:
+                    content_text = chunk["contentBlockDelta"]["delta"]["text"]
+                    if content_text:
+                        response_parts.append(content_text)
+                        # Send the chunk to the client
+                        client.post_to_connection(
+                            ConnectionId=connection_id,
+                            Data=json.dumps({
+                                "type": "text",
+                                "token": content_text,
+                                "last": False
+                            })
+                        )
+        except TimeoutError:
+            if not response_parts:
+                raise
+            # Close the turn with what the caller has already heard
+            logger.warning(f"Bedrock stream missed the turn deadline for {connection_id}, closing with partial response")
         
         # Send final message with last=True
         client.post_to_connection(
@@ -82,28 +295,290 @@ def ai_response(messages, connection_id, client):
             })
         )
         
-        return full_response
+        return "".join(response_parts)
     except Exception as e:
         logger.error(f"Error in streaming response: {str(e)}")
-        # Send error message to client
-        try:
-            client.post_to_connection(
-                ConnectionId=connection_id,
-                Data=json.dumps({
-                    "type": "text",
-                    "token": "I'm sorry, I'm having trouble processing your request right now.",
-                    "last": True
-                })
-            )
-        except Exception as post_error:
-            logger.error(f"Error sending error message to client: {str(post_error)}")
-        
-        return "I'm sorry, I'm having trouble processing your request right now."
+        return send_apology(connection_id, client)
+
+def send_apology(connection_id, client):
+    """Close the turn with an apology frame and return the apology text"""
+    try:
+        client.post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps({
+                "type": "text",
+                "token": APOLOGY_MESSAGE,
+                "last": True
+            })
+        )
+    except Exception as post_error:
+        logger.error(f"Error sending error message to client: {str(post_error)}")
+    
+    return APOLOGY_MESSAGE
+
+def speculative_response(messages, deadline=None, still_claimed=None):
+    """Generate a response from Amazon Bedrock and buffer it without sending it to the client"""
+    model_id = os.environ.get("BEDROCK_MODEL_ID", "amazon.nova-text-pro-v1")
+    formatted_messages, system_message = format_messages(messages)
+    
+    started = time.monotonic()
+    response = call_with_deadline(
+        bedrock_runtime.converse_stream,
+        deadline,
+        modelId=model_id,
+        messages=formatted_messages,
+        system=system_message,
+        inferenceConfig=INFERENCE_CONFIG,
+        on_abandon=lambda late_response: close_stream(late_response["stream"])
+    )
+    
+    parts = []
+    ttft_ms = None
+    output_tokens = None
+    superseded = False
+    events = stream_with_deadline(response["stream"], deadline)
+    for chunk in events:
+        if "contentBlockDelta" in chunk:
+            content_text = chunk["contentBlockDelta"]["delta"]["text"]
+            if content_text:
+                if ttft_ms is None:
+                    ttft_ms = (time.monotonic() - started) * 1000
+                parts.append(content_text)
+                # Stop paying for a generation nobody will use
+                if still_claimed and len(parts) % SPECULATIVE_CLAIM_CHECK_CHUNKS == 0 and not still_claimed():
+                    superseded = True
+                    events.close()
+                    close_stream(response["stream"])
+                    break
+        elif "metadata" in chunk:
+            output_tokens = chunk["metadata"].get("usage", {}).get("outputTokens")
+    
+    text = "".join(parts)
+    # Fall back to a word count when the stream carries no usage metadata
+    if output_tokens is None:
+        output_tokens = len(text.split())
+    
+    return {"text": text, "ttft_ms": ttft_ms or 0.0, "output_tokens": output_tokens, "superseded": superseded}
+
+def commit_speculation(text, connection_id, client):
+    """Send a buffered speculative response to the client as a completed turn"""
+    try:
+        client.post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps({
+                "type": "text",
+                "token": text,
+                "last": False
+            })
+        )
+        client.post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps({
+                "type": "text",
+                "token": "",
+                "last": True
+            })
+        )
+    except Exception as e:
+        logger.error(f"Error sending speculative response: {str(e)}")
+        # The caller did not hear the buffered answer, so it must not be saved as the turn
+        return send_apology(connection_id, client)
+    
+    return text
+
+def speculative_mode_enabled():
+    """Check whether speculative generation on partial prompts is turned on"""
+    return os.environ.get("SPECULATIVE_MODE", "false").lower() == "true"
+
+def normalize_prompt(prompt):
+    """Lowercase a transcript and strip punctuation so ASR revisions compare cleanly"""
+    return " ".join(re.sub(r"[^\w\s']", " ", (prompt or "").lower()).split())
 
-def get_session(connection_id):
+def prompts_match(speculated_prompt, prompt):
+    """Check whether a prompt repeats the speculated one word for word, allowing only a few trailing extra words"""
+    # Any substituted word (a negation, a number, a place) can change the answer, so only appends are tolerated
+    max_extra_words = int(os.environ.get("SPECULATIVE_MAX_EXTRA_WORDS", "0"))
+    speculated_words = normalize_prompt(speculated_prompt).split()
+    words = normalize_prompt(prompt).split()
+    return (words[:len(speculated_words)] == speculated_words
+            and len(words) - len(speculated_words) <= max_extra_words)
+
+def emit_speculation_metrics(**metrics):
+    """Emit one speculation outcome as a CloudWatch embedded metric format event"""
+    # Printed rather than logged: EMF events must be bare JSON lines without the logging prefix
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [[]],
+                "Metrics": [{"Name": name, "Unit": SPECULATION_METRIC_UNITS[name]} for name in metrics]
+            }]
+        },
+        **metrics
+    }))
+
+def get_speculation(connection_id):
+    """Get the buffered or in-flight speculation for a connection from DynamoDB"""
+    try:
+        response = table.get_item(Key={'connection_id': f"{connection_id}#speculation"})
+        if 'Item' in response:
+            return json.loads(response['Item']['speculation'])
+    except Exception as e:
+        logger.error(f"Error getting speculation: {str(e)}")
+    return None
+
+def put_speculation(connection_id, speculation, expected_id=None):
+    """Write a speculation only if the stored one is still expected_id (or absent), returning whether it was written"""
+    condition = {'ConditionExpression': "attribute_not_exists(connection_id)"}
+    if expected_id:
+        condition = {
+            'ConditionExpression': "speculation_id = :expected",
+            'ExpressionAttributeValues': {':expected': expected_id}
+        }
+    try:
+        table.put_item(
+            Item={
+                'connection_id': f"{connection_id}#speculation",
+                'speculation_id': speculation["id"],
+                'speculation': json.dumps(speculation),
+                'created_at': time.strftime('%Y-%m-%d %H:%M:%S UTC')
+            },
+            **condition
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            logger.error(f"Error saving speculation: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error saving speculation: {str(e)}")
+    return False
+
+def save_latest_partial(connection_id, partial_prompt):
+    """Record the newest partial prompt for a connection in DynamoDB"""
+    try:
+        table.put_item(
+            Item={
+                'connection_id': f"{connection_id}#partial",
+                'prompt': partial_prompt,
+                'created_at': time.strftime('%Y-%m-%d %H:%M:%S UTC')
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error saving partial prompt: {str(e)}")
+
+def get_latest_partial(connection_id):
+    """Get the newest partial prompt for a connection from DynamoDB"""
+    try:
+        response = table.get_item(Key={'connection_id': f"{connection_id}#partial"})
+        if 'Item' in response:
+            return response['Item']['prompt']
+    except Exception as e:
+        logger.error(f"Error getting partial prompt: {str(e)}")
+    return None
+
+def partial_is_stable(connection_id, partial_prompt, deadline=None):
+    """Wait for the stability window and check that no newer partial prompt has arrived"""
+    save_latest_partial(connection_id, partial_prompt)
+    
+    stable_seconds = int(os.environ.get("SPECULATIVE_STABLE_MS", "400")) / 1000
+    if deadline is not None:
+        stable_seconds = min(stable_seconds, max(0.0, deadline - time.monotonic()))
+    if stable_seconds > 0:
+        time.sleep(stable_seconds)
+    
+    # Cumulative partials add a word at a time, so only the last one before a pause is worth a generation
+    latest = get_latest_partial(connection_id)
+    return latest is None or normalize_prompt(latest) == normalize_prompt(partial_prompt)
+
+def take_speculation(connection_id):
+    """Atomically delete the speculation for a connection from DynamoDB and return it"""
+    try:
+        response = table.delete_item(Key={'connection_id': f"{connection_id}#speculation"}, ReturnValues='ALL_OLD')
+        if 'Attributes' in response:
+            return json.loads(response['Attributes']['speculation'])
+    except Exception as e:
+        logger.error(f"Error clearing speculation: {str(e)}")
+    return None
+
+def speculate(connection_id, partial_prompt, deadline=None):
+    """Start a buffered generation for a partial caller transcript"""
+    if len(normalize_prompt(partial_prompt).split()) < SPECULATIVE_MIN_WORDS:
+        return
+    if not partial_is_stable(connection_id, partial_prompt, deadline=deadline):
+        logger.info(f"Partial prompt for {connection_id} was superseded before it settled")
+        return
+    
+    conversation = get_session(connection_id, deadline=deadline)
+    existing = get_speculation(connection_id)
+    # Keep the buffered or in-flight answer while the transcript prefix is stable
+    if existing and existing["history_length"] == len(conversation) and prompts_match(existing["prompt"], partial_prompt):
+        logger.info(f"Speculation for {connection_id} still matches partial prompt")
+        return
+    
+    # Claim the slot before calling Bedrock so concurrent partials do not all generate
+    speculation = {
+        "id": uuid.uuid4().hex,
+        "status": "in_flight",
+        "prompt": partial_prompt,
+        "history_length": len(conversation)
+    }
+    if not put_speculation(connection_id, speculation, expected_id=existing["id"] if existing else None):
+        logger.info(f"Speculation for {connection_id} was claimed by another partial prompt")
+        return
+    if existing and existing["status"] == "ready":
+        emit_speculation_metrics(SpeculationWastedTokens=existing["output_tokens"])
+    
+    def still_claimed():
+        current = get_speculation(connection_id)
+        return current is not None and current["id"] == speculation["id"]
+    
+    conversation.append({"role": "user", "content": partial_prompt})
+    try:
+        result = speculative_response(conversation, deadline=deadline, still_claimed=still_claimed)
+    except Exception as e:
+        logger.error(f"Error in speculative response: {str(e)}")
+        return
+    
+    if result.pop("superseded"):
+        emit_speculation_metrics(SpeculationWastedTokens=result["output_tokens"])
+        logger.info(f"Cancelled superseded speculation for {connection_id}: {partial_prompt}")
+        return
+    speculation.update(result, status="ready")
+    
+    # The claim is gone if a newer partial replaced it or the final prompt already resolved it
+    if not put_speculation(connection_id, speculation, expected_id=speculation["id"]):
+        emit_speculation_metrics(SpeculationWastedTokens=speculation["output_tokens"])
+        logger.info(f"Discarded superseded speculation for {connection_id}: {partial_prompt}")
+        return
+    logger.info(f"Buffered speculative response for {connection_id}: {partial_prompt}")
+
+def resolve_speculation(connection_id, conversation, voice_prompt):
+    """Return the buffered response if it matches the final prompt, otherwise discard it"""
+    speculation = take_speculation(connection_id)
+    if speculation is None:
+        # Nothing was speculated, e.g. every partial was below SPECULATIVE_MIN_WORDS
+        emit_speculation_metrics(SpeculationNotAttempted=1)
+        return None
+    
+    ready = speculation["status"] == "ready"
+    if (ready and speculation["text"]
+            and speculation["history_length"] == len(conversation)
+            and prompts_match(speculation["prompt"], voice_prompt)):
+        emit_speculation_metrics(SpeculationHit=1, SpeculationTtftSavedMs=speculation["ttft_ms"])
+        return speculation
+    
+    # An in-flight speculation emits its own wasted tokens when its save is rejected
+    if ready:
+        emit_speculation_metrics(SpeculationMiss=1, SpeculationWastedTokens=speculation["output_tokens"])
+    else:
+        emit_speculation_metrics(SpeculationMiss=1)
+    return None
+
+def get_session(connection_id, deadline=None):
     """Get conversation session from DynamoDB"""
     try:
-        response = table.get_item(Key={'connection_id': connection_id})
+        response = call_with_deadline(table.get_item, deadline, Key={'connection_id': connection_id})
         if 'Item' in response:
             return json.loads(response['Item']['conversation'])
         return [{"role": "system", "content": SYSTEM_PROMPT}]
@@ -111,10 +586,12 @@ def get_session(connection_id):
         logger.error(f"Error getting session: {str(e)}")
         return [{"role": "system", "content": SYSTEM_PROMPT}]
 
-def save_session(connection_id, conversation):
+def save_session(connection_id, conversation, deadline=None):
     """Save conversation session to DynamoDB"""
     try:
-        table.put_item(
+        call_with_deadline(
+            table.put_item,
+            deadline,
             Item={
                 'connection_id': connection_id,
                 'conversation': json.dumps(conversation),
@@ -150,7 +627,12 @@ def lambda_handler(event, context):
         endpoint = f"https://{domain}/{stage}"
         client = boto3.client('apigatewaymanagementapi', 
                             endpoint_url=endpoint,
-                            region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+                            region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+                            config=APIGW_CLIENT_CONFIG)
+        
+        # Deadline for Bedrock and session reads, and the later one for closing the turn
+        deadline = turn_deadline(context)
+        close_deadline = turn_deadline(context, reserve_ms=CLOSE_TURN_MARGIN_MS)
         
         if route_key == '$connect':
             logger.info(f"Client connected: {connection_id}")
@@ -172,26 +654,43 @@ def lambda_handler(event, context):
                         # Initialize session in DynamoDB
                         save_session(connection_id, [{"role": "system", "content": SYSTEM_PROMPT}])
                         
+                    elif message.get("type") == "prompt" and message.get("last") is False:
+                        if speculative_mode_enabled():
+                            speculate(connection_id, message.get("voicePrompt"), deadline=deadline)
+                        
                     elif message.get("type") == "prompt":
                         voice_prompt = message.get("voicePrompt")
                             
                         logger.info(f"Processing prompt for {connection_id}: {voice_prompt}")
+                        memory_profile.clear()
                         
                         # Get conversation history
-                        conversation = get_session(connection_id)
+                        with profile_stage("get_session"):
+                            conversation = get_session(connection_id, deadline=deadline)
+                        
+                        speculation = None
+                        if speculative_mode_enabled():
+                            speculation = resolve_speculation(connection_id, conversation, voice_prompt)
                         
                         # Add user message
                         conversation.append({"role": "user", "content": voice_prompt})
                         
-                        # Get AI response with streaming
-                        response = ai_response(messages=conversation, connection_id=connection_id, client=client)
+                        with profile_stage("ai_response"):
+                            if speculation:
+                                # Commit the buffered answer generated from the partial prompt
+                                response = commit_speculation(speculation["text"], connection_id, client)
+                            else:
+                                # Get AI response with streaming
+                                response = ai_response(messages=conversation, connection_id=connection_id, client=client, deadline=deadline)
                         
                         # Add assistant response to conversation
                         conversation.append({"role": "assistant", "content": response})
                         
                         # Save updated conversation
-                        save_session(connection_id, conversation)
+                        with profile_stage("save_session"):
+                            save_session(connection_id, conversation, deadline=close_deadline)
                         
+                        log_memory_profile()
                         logger.info(f"Sent streaming response completed")
                     elif message.get("type") == "interrupt":
                         logger.info("Handling interruption.")
@@ -2,12 +2,13 @@ import json
 import os
 import pytest
 import boto3
+import tracemalloc
 from unittest.mock import patch, MagicMock
 
 # Import the lambda handler
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from src.websocket.app import lambda_handler, get_session, save_session, ai_response
+from src.websocket.app import lambda_handler, get_session, save_session, ai_response, memory_profile
 
 
 class TestWebSocketHandlers:
@@ -51,6 +52,29 @@ class TestWebSocketHandlers:
             assert call_kwargs.get('client') is not None
             mock_aws_clients['table'].put_item.assert_called()
     
+    def test_prompt_handler_memory_profile(self, websocket_prompt_event, mock_aws_clients, monkeypatch):
+        """Test that profiling mode tracks the ai_response peak and stops tracing after the turn"""
+        monkeypatch.setenv('PROFILE_MEMORY', 'true')
+        
+        def profile_turn(deltas):
+            mock_aws_clients['bedrock'].converse_stream.return_value = {
+                "stream": [{"contentBlockDelta": {"delta": {"text": "x" * 100}}} for _ in range(deltas)]
+            }
+            with patch('boto3.client') as mock_client:
+                mock_client.return_value = MagicMock()
+                lambda_handler(websocket_prompt_event, {})
+            assert not tracemalloc.is_tracing()
+            return dict(memory_profile)
+        
+        small = profile_turn(1)
+        large = profile_turn(2000)
+        
+        for stage in ("get_session", "ai_response", "save_session"):
+            assert stage in large
+        # Two thousand 100-character deltas must show up as a much higher streaming peak
+        assert large["ai_response"]["peak_kb"] > small["ai_response"]["peak_kb"] + 100
+        assert large["max_rss_mb"] > 0
+    
     def test_interrupt_handler(self, websocket_interrupt_event):
         """Test the WebSocket interrupt message handler"""
         with patch('boto3.client') as mock_client:
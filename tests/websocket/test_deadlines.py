@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+# Import the lambda handler
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.websocket.app import (lambda_handler, get_session, ai_response, turn_deadline, call_with_deadline,
+                               stream_with_deadline, worst_case_call_ms, APIGW_CLIENT_CONFIG,
+                               DYNAMODB_CLIENT_CONFIG, CLOSE_TURN_MARGIN_MS, CLOSE_TURN_RESERVE_MS,
+                               DEFAULT_REMAINING_MS)
+
+
+class FakeContext:
+    """Lambda context stand-in with a fixed remaining time"""
+
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+@pytest.fixture
+def stall():
+    """Event that fake slow endpoints block on, released when the test finishes"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def slow_stream(stall, tokens):
+    """Bedrock stream that yields some tokens and then stalls"""
+    for token in tokens:
+        yield {"contentBlockDelta": {"delta": {"text": token}}}
+    stall.wait(5)
+    yield {"contentBlockDelta": {"delta": {"text": "never heard"}}}
+
+
+class StalledStream:
+    """Bedrock EventStream stand-in that blocks until closed"""
+
+    def __init__(self, stall):
+        self.stall = stall
+        self.closed = False
+
+    def __iter__(self):
+        self.stall.wait(5)
+        return iter([])
+
+    def close(self):
+        self.closed = True
+        self.stall.set()
+
+
+def test_reserve_covers_close_turn_worst_case(env_vars):
+    """Test that the reserve fits an in-flight frame, the final frame and the session save"""
+    assert CLOSE_TURN_RESERVE_MS >= (2 * worst_case_call_ms(APIGW_CLIENT_CONFIG)
+                                     + worst_case_call_ms(DYNAMODB_CLIENT_CONFIG)
+                                     + CLOSE_TURN_MARGIN_MS)
+    # Delta frames keep a retry for transient throttles and 5xx responses
+    assert APIGW_CLIENT_CONFIG.retries["max_attempts"] >= 2
+
+
+def test_stalled_calls_do_not_block_later_calls(stall, env_vars):
+    """Test that abandoned slow calls leave no backlog for the next call"""
+    for _ in range(8):
+        with pytest.raises(TimeoutError):
+            call_with_deadline(stall.wait, time.monotonic() + 0.05, 5)
+
+    started = time.monotonic()
+    assert call_with_deadline(lambda: "fast", time.monotonic() + 1) == "fast"
+    assert time.monotonic() - started < 0.5
+
+
+def test_stream_closed_when_deadline_missed(stall, env_vars):
+    """Test that a stalled Bedrock stream is closed once the deadline passes"""
+    stream = StalledStream(stall)
+
+    with pytest.raises(TimeoutError):
+        list(stream_with_deadline(stream, time.monotonic() + 0.1))
+
+    assert stream.closed
+
+
+def test_turn_deadline_keeps_reserve(env_vars):
+    """Test that the deadline leaves the close-turn reserve out of the remaining time"""
+    before = time.monotonic()
+    deadline = turn_deadline(FakeContext(CLOSE_TURN_RESERVE_MS + 7000))
+
+    assert deadline - before == pytest.approx(7, abs=0.05)
+
+
+def test_turn_deadline_without_context(env_vars):
+    """Test that a missing Lambda context falls back to the function Timeout"""
+    before = time.monotonic()
+    deadline = turn_deadline({})
+
+    assert deadline - before == pytest.approx((DEFAULT_REMAINING_MS - CLOSE_TURN_RESERVE_MS) / 1000, abs=0.05)
+
+
+def test_slow_stream_closes_turn_with_partial_response(mock_aws_clients, websocket_prompt_event, stall):
+    """Test that a stalled Bedrock stream still ends with last=True and saves the partial answer"""
+    mock_aws_clients['bedrock'].converse_stream.return_value = {"stream": slow_stream(stall, ["Hello ", "there"])}
+
+    with patch('boto3.client') as mock_client:
+        mock_apigw = MagicMock()
+        mock_client.return_value = mock_apigw
+
+        started = time.monotonic()
+        response = lambda_handler(websocket_prompt_event, FakeContext(CLOSE_TURN_RESERVE_MS + 300))
+
+        assert time.monotonic() - started < 2
+        assert response['statusCode'] == 200
+        frames = [json.loads(c.kwargs['Data']) for c in mock_apigw.post_to_connection.call_args_list]
+        assert [frame['token'] for frame in frames] == ["Hello ", "there", ""]
+        assert frames[-1]['last'] is True
+
+    saved = json.loads(mock_aws_clients['table'].put_item.call_args.kwargs['Item']['conversation'])
+    assert saved[-1] == {"role": "assistant", "content": "Hello there"}
+
+
+def test_slow_converse_stream_sends_apology(mock_aws_clients, stall):
+    """Test that a Bedrock call that never starts streaming ends the turn with an apology"""
+    mock_aws_clients['bedrock'].converse_stream.side_effect = lambda **kwargs: stall.wait(5)
+    mock_client = MagicMock()
+
+    started = time.monotonic()
+    response = ai_response(messages=[{"role": "user", "content": "Hello"}], connection_id='test-connection-id',
+                           client=mock_client, deadline=time.monotonic() + 0.2)
+
+    assert time.monotonic() - started < 2
+    assert "I'm sorry" in response
+    data = json.loads(mock_client.post_to_connection.call_args.kwargs['Data'])
+    assert data['last'] is True
+
+
+def test_slow_dynamodb_get_session_falls_back(mock_aws_clients, stall, env_vars):
+    """Test that a stalled DynamoDB read returns a fresh session before the deadline"""
+    mock_aws_clients['table'].get_item.side_effect = lambda **kwargs: stall.wait(5)
+
+    started = time.monotonic()
+    conversation = get_session('test-connection-id', deadline=time.monotonic() + 0.2)
+
+    assert time.monotonic() - started < 2
+    assert len(conversation) == 1
+    assert conversation[0]['role'] == 'system'
+
+
+def test_slow_api_gateway_still_closes_and_saves_turn(mock_aws_clients, websocket_prompt_event):
+    """Test that slow client posts stop at the deadline and the turn is still closed and saved"""
+    mock_aws_clients['bedrock'].converse_stream.return_value = {
+        "stream": [{"contentBlockDelta": {"delta": {"text": f"word{i} "}}} for i in range(20)]
+    }
+
+    with patch('boto3.client') as mock_client:
+        mock_apigw = MagicMock()
+        mock_apigw.post_to_connection.side_effect = lambda **kwargs: time.sleep(0.2)
+        mock_client.return_value = mock_apigw
+
+        started = time.monotonic()
+        lambda_handler(websocket_prompt_event, FakeContext(CLOSE_TURN_RESERVE_MS + 500))
+
+        assert time.monotonic() - started < 1.5
+        frames = [json.loads(c.kwargs['Data']) for c in mock_apigw.post_to_connection.call_args_list]
+        assert len(frames) < 21
+        assert frames[-1] == {"type": "text", "token": "", "last": True}
+
+    saved = json.loads(mock_aws_clients['table'].put_item.call_args.kwargs['Item']['conversation'])
+    assert saved[-1] == {"role": "assistant", "content": "".join(frame['token'] for frame in frames)}
+
+
+def test_late_converse_stream_is_closed(mock_aws_clients, stall):
+    """Test that a Bedrock stream returned after the deadline was missed is still closed"""
+    stream = StalledStream(threading.Event())
+    returned = threading.Event()
+
+    def late_converse_stream(**kwargs):
+        stall.wait(5)
+        returned.set()
+        return {"stream": stream}
+
+    mock_aws_clients['bedrock'].converse_stream.side_effect = late_converse_stream
+
+    response = ai_response(messages=[{"role": "user", "content": "Hello"}], connection_id='test-connection-id',
+                           client=MagicMock(), deadline=time.monotonic() + 0.1)
+    assert "I'm sorry" in response
+    assert not stream.closed
+
+    stall.set()
+    assert returned.wait(1)
+    for _ in range(100):
+        if stream.closed:
+            break
+        time.sleep(0.01)
+    assert stream.closed
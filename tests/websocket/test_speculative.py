@@ -0,0 +1,349 @@
+import json
+import os
+import time
+import pytest
+from collections import Counter
+from botocore.exceptions import ClientError
+from unittest.mock import patch, MagicMock
+
+# Import the lambda handler
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import src.websocket.app as app
+from src.websocket.app import lambda_handler, prompts_match
+
+
+def prompt_event(voice_prompt, last):
+    """Create a mock WebSocket prompt event, partial when last is False"""
+    return {
+        'requestContext': {
+            'connectionId': 'test-connection-id',
+            'routeKey': '$default',
+            'domainName': 'test-domain.execute-api.us-east-1.amazonaws.com',
+            'stage': 'prod'
+        },
+        'body': json.dumps({
+            'type': 'prompt',
+            'voicePrompt': voice_prompt,
+            'lang': 'en-US',
+            'last': last
+        })
+    }
+
+
+@pytest.fixture
+def speculative_env(monkeypatch, env_vars):
+    """Enable speculative mode without a stability wait"""
+    monkeypatch.setenv('SPECULATIVE_MODE', 'true')
+    monkeypatch.setenv('SPECULATIVE_STABLE_MS', '0')
+
+
+@pytest.fixture
+def speculation_metrics(monkeypatch):
+    """Sum the speculation metric events emitted during a test"""
+    totals = Counter()
+    monkeypatch.setattr(app, 'emit_speculation_metrics', lambda **metrics: totals.update(metrics))
+    return totals
+
+
+@pytest.fixture
+def speculation_store(mock_aws_clients):
+    """Back the mocked table with a dict so speculations persist between invocations"""
+    items = {
+        'test-connection-id': {
+            'connection_id': 'test-connection-id',
+            'conversation': json.dumps([{"role": "system", "content": "You are a helpful assistant."}])
+        }
+    }
+
+    def put_item(Item, ConditionExpression=None, ExpressionAttributeValues=None):
+        stored = items.get(Item['connection_id'])
+        if ConditionExpression == "attribute_not_exists(connection_id)":
+            rejected = stored is not None
+        elif ConditionExpression == "speculation_id = :expected":
+            rejected = stored is None or stored.get('speculation_id') != ExpressionAttributeValues[':expected']
+        else:
+            rejected = False
+        if rejected:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+        items[Item['connection_id']] = Item
+
+    def delete_item(Key, ReturnValues=None):
+        stored = items.pop(Key['connection_id'], None)
+        return {'Attributes': stored} if stored else {}
+
+    table = mock_aws_clients['table']
+    table.get_item.side_effect = lambda Key: {'Item': items[Key['connection_id']]} if Key['connection_id'] in items else {}
+    table.put_item.side_effect = put_item
+    table.delete_item.side_effect = delete_item
+    return items
+
+
+class ClaimCheckedStream:
+    """Bedrock EventStream stand-in that hands over its claim partway through and records closing"""
+
+    def __init__(self, chunks, on_chunk):
+        self.chunks = chunks
+        self.on_chunk = on_chunk
+        self.yielded = 0
+        self.closed = False
+
+    def __iter__(self):
+        for i in range(self.chunks):
+            if self.closed:
+                return
+            self.on_chunk(i)
+            self.yielded += 1
+            yield {"contentBlockDelta": {"delta": {"text": f"word{i} "}}}
+
+    def close(self):
+        self.closed = True
+
+
+def overlapping_bedrock(mock_aws_clients, during_first_call):
+    """Make the first Bedrock generation run another invocation before it finishes"""
+    calls = []
+
+    def converse_stream(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            during_first_call()
+        return {"stream": [{"contentBlockDelta": {"delta": {"text": f"Answer {len(calls)}"}}}]}
+
+    mock_aws_clients['bedrock'].converse_stream.side_effect = converse_stream
+    return calls
+
+
+def test_prompts_match_ignores_case_and_punctuation(env_vars):
+    """Test that ASR punctuation and casing revisions still count as a match"""
+    assert prompts_match("what is the weather in boston", "What is the weather in Boston?")
+    assert not prompts_match("what is the weather in boston", "What is the time in Denver?")
+
+
+def test_prompts_match_rejects_substituted_words(env_vars):
+    """Test that negations, number and place substitutions never match"""
+    assert not prompts_match("I want to cancel my appointment tomorrow", "I do not want to cancel my appointment tomorrow")
+    assert not prompts_match("Yes I would like to confirm the order", "No I would like to confirm the order")
+    assert not prompts_match("Please transfer five hundred dollars to savings",
+                             "Please transfer nine hundred dollars to savings")
+    assert not prompts_match("What is the weather in Boston", "What is the weather in Bosnia")
+
+
+def test_prompts_match_extra_word_tolerance(monkeypatch, env_vars):
+    """Test that trailing words are only accepted up to the configured tolerance"""
+    assert not prompts_match("What is the weather in Boston", "What is the weather in Boston today")
+
+    monkeypatch.setenv('SPECULATIVE_MAX_EXTRA_WORDS', '1')
+    assert prompts_match("What is the weather in Boston", "What is the weather in Boston today")
+    assert not prompts_match("What is the weather in Boston", "What is the weather in Boston today please")
+    assert not prompts_match("What is the weather in Boston", "What is the weather in")
+
+
+def test_partial_prompt_ignored_when_disabled(mock_aws_clients, env_vars):
+    """Test that partial prompts do not trigger generation without speculative mode"""
+    lambda_handler(prompt_event("What is the weather in", False), {})
+
+    mock_aws_clients['bedrock'].converse_stream.assert_not_called()
+    mock_aws_clients['table'].put_item.assert_not_called()
+
+
+def test_partial_prompt_buffers_without_sending(mock_aws_clients, speculative_env, speculation_store):
+    """Test that a partial prompt starts a generation but sends nothing to the client"""
+    with patch('boto3.client') as mock_client:
+        mock_apigw = MagicMock()
+        mock_client.return_value = mock_apigw
+
+        lambda_handler(prompt_event("What is the weather in Boston", False), {})
+
+        mock_aws_clients['bedrock'].converse_stream.assert_called_once()
+        mock_apigw.post_to_connection.assert_not_called()
+        speculation = json.loads(speculation_store['test-connection-id#speculation']['speculation'])
+        assert speculation['text'] == "This is a test response"
+        assert speculation['prompt'] == "What is the weather in Boston"
+
+
+def test_short_partial_prompt_not_speculated(mock_aws_clients, speculative_env, speculation_store):
+    """Test that partial prompts below the minimum word count are skipped"""
+    lambda_handler(prompt_event("What", False), {})
+
+    mock_aws_clients['bedrock'].converse_stream.assert_not_called()
+
+
+def test_stable_partial_prompt_reuses_speculation(mock_aws_clients, speculative_env, speculation_store):
+    """Test that a revised but matching partial prompt does not regenerate"""
+    lambda_handler(prompt_event("What is the weather in Boston", False), {})
+    lambda_handler(prompt_event("What is the weather in Boston?", False), {})
+
+    assert mock_aws_clients['bedrock'].converse_stream.call_count == 1
+
+
+def test_matching_final_prompt_commits_speculation(mock_aws_clients, speculative_env, speculation_store,
+                                                   speculation_metrics):
+    """Test that a matching final prompt sends the buffered answer without a new generation"""
+    lambda_handler(prompt_event("What is the weather in Boston", False), {})
+
+    with patch('boto3.client') as mock_client:
+        mock_apigw = MagicMock()
+        mock_client.return_value = mock_apigw
+
+        lambda_handler(prompt_event("What is the weather in Boston?", True), {})
+
+        assert mock_aws_clients['bedrock'].converse_stream.call_count == 1
+        frames = [json.loads(c.kwargs['Data']) for c in mock_apigw.post_to_connection.call_args_list]
+        assert frames[0]['token'] == "This is a test response"
+        assert frames[-1]['last'] is True
+
+    assert 'test-connection-id#speculation' not in speculation_store
+    conversation = json.loads(speculation_store['test-connection-id']['conversation'])
+    assert conversation[-1] == {"role": "assistant", "content": "This is a test response"}
+    assert speculation_metrics['SpeculationHit'] == 1
+    assert speculation_metrics['SpeculationWastedTokens'] == 0
+
+
+def test_mismatched_final_prompt_regenerates(mock_aws_clients, speculative_env, speculation_store, speculation_metrics):
+    """Test that a diverging final prompt discards the speculation and regenerates"""
+    lambda_handler(prompt_event("What is the weather in Boston", False), {})
+
+    with patch('src.websocket.app.ai_response') as mock_ai_response:
+        mock_ai_response.return_value = "It is three o'clock."
+        lambda_handler(prompt_event("What time is it in Denver right now", True), {})
+
+        mock_ai_response.assert_called_once()
+        user_messages = [m['content'] for m in mock_ai_response.call_args.kwargs['messages'] if m['role'] == 'user']
+        assert user_messages == ["What time is it in Denver right now"]
+
+    assert 'test-connection-id#speculation' not in speculation_store
+    assert speculation_metrics['SpeculationMiss'] == 1
+    assert speculation_metrics['SpeculationWastedTokens'] == len("This is a test response".split())
+
+
+def test_overlapping_matching_partial_waits_for_in_flight(mock_aws_clients, speculative_env, speculation_store):
+    """Test that a matching partial arriving mid-generation does not start a second generation"""
+    calls = overlapping_bedrock(mock_aws_clients,
+                                lambda: lambda_handler(prompt_event("What is the weather in Boston?", False), {}))
+
+    lambda_handler(prompt_event("What is the weather in Boston", False), {})
+
+    assert len(calls) == 1
+    speculation = json.loads(speculation_store['test-connection-id#speculation']['speculation'])
+    assert speculation['status'] == "ready"
+    assert speculation['text'] == "Answer 1"
+
+
+def test_overlapping_diverging_partial_counts_superseded_tokens(mock_aws_clients, speculative_env, speculation_store,
+                                                                speculation_metrics):
+    """Test that a generation replaced mid-flight is discarded and its tokens counted as wasted"""
+    calls = overlapping_bedrock(mock_aws_clients,
+                                lambda: lambda_handler(prompt_event("What is the time in Denver", False), {}))
+
+    lambda_handler(prompt_event("What is the weather in Boston", False), {})
+
+    assert len(calls) == 2
+    speculation = json.loads(speculation_store['test-connection-id#speculation']['speculation'])
+    assert speculation['prompt'] == "What is the time in Denver"
+    assert speculation['text'] == "Answer 2"
+    assert speculation_metrics['SpeculationWastedTokens'] == len("Answer 1".split())
+
+
+def test_final_prompt_during_generation_leaves_no_stale_speculation(mock_aws_clients, speculative_env, speculation_store,
+                                                                    speculation_metrics):
+    """Test that a speculation finishing after the final prompt resolved it is not stored"""
+    def final_prompt():
+        with patch('src.websocket.app.ai_response') as mock_ai_response:
+            mock_ai_response.return_value = "It is sunny."
+            lambda_handler(prompt_event("What is the weather in Boston", True), {})
+
+    overlapping_bedrock(mock_aws_clients, final_prompt)
+
+    lambda_handler(prompt_event("What is the weather in Boston", False), {})
+
+    assert 'test-connection-id#speculation' not in speculation_store
+    assert speculation_metrics['SpeculationMiss'] == 1
+    assert speculation_metrics['SpeculationWastedTokens'] == len("Answer 1".split())
+
+
+def test_partial_superseded_during_stability_window(mock_aws_clients, speculative_env, speculation_store, monkeypatch):
+    """Test that cumulative partials only generate for the one that stopped changing"""
+    monkeypatch.setenv('SPECULATIVE_STABLE_MS', '50')
+    real_sleep = app.time.sleep
+    newer_partial_sent = []
+
+    def sleep(seconds):
+        # The next cumulative partial arrives while the first one waits
+        if not newer_partial_sent:
+            newer_partial_sent.append(True)
+            lambda_handler(prompt_event("What is the weather in Boston today", False), {})
+        real_sleep(0)
+
+    monkeypatch.setattr(app.time, 'sleep', sleep)
+
+    lambda_handler(prompt_event("What is the weather in Boston", False), {})
+
+    mock_aws_clients['bedrock'].converse_stream.assert_called_once()
+    speculation = json.loads(speculation_store['test-connection-id#speculation']['speculation'])
+    assert speculation['prompt'] == "What is the weather in Boston today"
+
+
+def test_superseded_generation_is_cancelled(mock_aws_clients, speculative_env, speculation_store, speculation_metrics):
+    """Test that a generation whose claim was taken over closes its stream early"""
+    def take_over_claim(i):
+        # Pace the stream like a real model so the reader cannot run far ahead
+        time.sleep(0.005)
+        if i == 3:
+            newer = {"id": "newer-claim", "status": "in_flight", "prompt": "What is the time", "history_length": 1}
+            speculation_store['test-connection-id#speculation'] = {
+                'connection_id': 'test-connection-id#speculation',
+                'speculation_id': "newer-claim",
+                'speculation': json.dumps(newer)
+            }
+
+    stream = ClaimCheckedStream(100, take_over_claim)
+    mock_aws_clients['bedrock'].converse_stream.return_value = {"stream": stream}
+
+    lambda_handler(prompt_event("What is the weather in Boston", False), {})
+
+    assert stream.closed
+    assert stream.yielded < 100
+    assert speculation_store['test-connection-id#speculation']['speculation_id'] == "newer-claim"
+    assert speculation_metrics['SpeculationWastedTokens'] == app.SPECULATIVE_CLAIM_CHECK_CHUNKS
+
+
+def test_final_prompt_without_speculation_is_not_attempted(mock_aws_clients, speculative_env, speculation_store,
+                                                          speculation_metrics):
+    """Test that a short final prompt with no speculation is not counted as a miss"""
+    with patch('src.websocket.app.ai_response') as mock_ai_response:
+        mock_ai_response.return_value = "Great."
+        lambda_handler(prompt_event("Yes", True), {})
+
+    assert speculation_metrics == {"SpeculationNotAttempted": 1}
+
+
+def test_speculation_metrics_are_embedded_metric_events(capsys, env_vars):
+    """Test that each outcome is printed as one aggregatable CloudWatch EMF event"""
+    app.emit_speculation_metrics(SpeculationHit=1, SpeculationTtftSavedMs=420.0)
+
+    event = json.loads(capsys.readouterr().out)
+    directive = event["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == app.METRICS_NAMESPACE
+    assert {metric["Name"] for metric in directive["Metrics"]} == {"SpeculationHit", "SpeculationTtftSavedMs"}
+    assert event["SpeculationHit"] == 1
+    assert event["SpeculationTtftSavedMs"] == 420.0
+
+
+def test_failed_commit_sends_and_saves_apology(mock_aws_clients, speculative_env, speculation_store,
+                                               speculation_metrics):
+    """Test that a buffered answer the caller never heard is replaced by the apology"""
+    lambda_handler(prompt_event("What is the weather in Boston", False), {})
+
+    with patch('boto3.client') as mock_client:
+        mock_apigw = MagicMock()
+        mock_apigw.post_to_connection.side_effect = [Exception("Gone"), None]
+        mock_client.return_value = mock_apigw
+
+        lambda_handler(prompt_event("What is the weather in Boston", True), {})
+
+        frames = [json.loads(c.kwargs['Data']) for c in mock_apigw.post_to_connection.call_args_list]
+        assert frames[-1] == {"type": "text", "token": app.APOLOGY_MESSAGE, "last": True}
+
+    conversation = json.loads(speculation_store['test-connection-id']['conversation'])
+    assert conversation[-1] == {"role": "assistant", "content": app.APOLOGY_MESSAGE}
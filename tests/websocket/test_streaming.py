@@ -6,7 +6,7 @@ from unittest.mock import patch, MagicMock
 # Import the lambda handler
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from src.websocket.app import lambda_handler
+from src.websocket.app import lambda_handler, ai_response
 
 
 @pytest.fixture
@@ -49,4 +49,20 @@ def test_streaming_response_format(mock_ai_response, websocket_streaming_event,
         # Check that connection_id and client were passed to enable streaming
         call_kwargs = mock_ai_response.call_args.kwargs
         assert call_kwargs.get('connection_id') == 'test-connection-id'
-        assert call_kwargs.get('client') is not None
\ No newline at end of file
+        assert call_kwargs.get('client') is not None
+
+
+def test_streamed_deltas_joined_in_order(mock_aws_clients, env_vars):
+    """Test that every streamed delta is forwarded and the full response is joined in order"""
+    mock_aws_clients['bedrock'].converse_stream.return_value = {
+        "stream": [{"contentBlockDelta": {"delta": {"text": token}}} for token in ("Once ", "upon ", "a time")]
+    }
+    mock_client = MagicMock()
+    
+    response = ai_response(messages=[{"role": "user", "content": "Tell me a story"}],
+                           connection_id='test-connection-id', client=mock_client)
+    
+    assert response == "Once upon a time"
+    frames = [json.loads(c.kwargs['Data']) for c in mock_client.post_to_connection.call_args_list]
+    assert [frame['token'] for frame in frames] == ["Once ", "upon ", "a time", ""]
+    assert frames[-1]['last'] is True